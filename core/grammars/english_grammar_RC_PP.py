@@ -12,6 +12,15 @@ from .generator import grep_next_subtree
 
 from .keybaseddefaultdict import KeyBasedDefaultDict
 
+# patterns used for every generated example, compiled once here
+_RE_DP 				= re.compile(r'^DP$')
+_RE_NP 				= re.compile(r'^NP$')
+_RE_VP 				= re.compile(r'^VP$')
+_RE_V 				= re.compile(r'^V$')
+_RE_N 				= re.compile(r'^N_')
+_RE_TRAILING_NUM 	= re.compile(r'_(.*)$')
+_RE_FINAL_S 		= re.compile(r's$')
+
 # this creates a dictionary that returns a default string for sg and pl
 # based on the value of the key passed to it
 # override for specific verbs that display non-default behavior as below
@@ -110,17 +119,17 @@ def reinflect(t: Tree) -> Tree:
 	t_copy = t.copy(deep=True)
 	
 	# get the main clause verb
-	main_clause_VP = grep_next_subtree(t_copy, r'^VP$')
-	main_clause_V = grep_next_subtree(main_clause_VP, r'^V$')
+	main_clause_VP = grep_next_subtree(t_copy, _RE_VP)
+	main_clause_V = grep_next_subtree(main_clause_VP, _RE_V)
 	
 	# get the number of the main clause subject
-	main_clause_subject = grep_next_subtree(t_copy, r'^DP$')
-	main_clause_subject = grep_next_subtree(main_clause_subject, r'^NP$')
-	while grep_next_subtree(main_clause_subject[0], r'^NP$'):
-		main_clause_subject = grep_next_subtree(main_clause_subject[0], r'^NP$')
+	main_clause_subject = grep_next_subtree(t_copy, _RE_DP)
+	main_clause_subject = grep_next_subtree(main_clause_subject, _RE_NP)
+	while grep_next_subtree(main_clause_subject[0], _RE_NP):
+		main_clause_subject = grep_next_subtree(main_clause_subject[0], _RE_NP)
 	
-	main_clause_subject = grep_next_subtree(main_clause_subject, r'^N_')
-	subject_number = 'sg' if str(main_clause_subject.label()).endswith('sg') else 'pl'
+	main_clause_subject = grep_next_subtree(main_clause_subject, _RE_N)
+	subject_number = 'sg' if main_clause_subject.label().symbol()[-2:] == 'sg' else 'pl'
 	
 	# map the past form of the verb to the present form based on the number of the subject
 	main_clause_V[0] = PAST_PRES[subject_number][main_clause_V[0]]
@@ -139,7 +148,7 @@ def pres_or_past_no_pres_dist(grammar: PCFG, pres_p: float = 0.5) -> Tuple:
 	# in fact, we WANT some of these for training
 	if pfx == 'pres':
 		# otherwise, we need to modify the tree to change the number of all interveners to match the subject's number
-		main_clause_subject = grep_next_subtree(source, r'^DP$')
+		main_clause_subject = grep_next_subtree(source, _RE_DP)
 		
 		# this works now because the main clause subject is always the first noun!
 		# it will need to be changed if we add nouns before the main clause subject
@@ -147,27 +156,27 @@ def pres_or_past_no_pres_dist(grammar: PCFG, pres_p: float = 0.5) -> Tuple:
 			pos 
 			for pos in main_clause_subject.treepositions() 
 			if 	not isinstance(main_clause_subject[pos],str) and 
-				re.search(r'^N_', str(main_clause_subject[pos].label()))
+				_RE_N.search(str(main_clause_subject[pos].label()))
 		]
 		main_clause_subject_pos = pre_verb_noun_positions[0]
 		
 		if len(pre_verb_noun_positions) > 1:
-			main_clause_subject_number = re.findall(r'_(.*)', str(main_clause_subject[main_clause_subject_pos].label()))[0]
+			main_clause_subject_number = _RE_TRAILING_NUM.search(str(main_clause_subject[main_clause_subject_pos].label())).group(1)
 			intervener_positions = [
 				pos 
 				for pos in pre_verb_noun_positions[1:] 
-					if not re.findall(r'_(.*)', str(main_clause_subject[pos].label()))[0] == main_clause_subject_number
+					if not _RE_TRAILING_NUM.search(str(main_clause_subject[pos].label())).group(1) == main_clause_subject_number
 			]
 			
 			for t in [source, target]:
 				
-				main_clause_subject = grep_next_subtree(t, r'^DP$')
+				main_clause_subject = grep_next_subtree(t, _RE_DP)
 				
 				for pos in intervener_positions:
 					if main_clause_subject_number == 'sg':
 						main_clause_subject[pos] = Tree(
 							main_clause_subject[main_clause_subject_pos].label(),
-							[re.sub('s$', '', main_clause_subject[pos][0])]
+							[_RE_FINAL_S.sub('', main_clause_subject[pos][0])]
 						)
 					elif main_clause_subject_number == 'pl':
 						if not main_clause_subject[pos][0].endswith('s'):
@@ -5,18 +5,42 @@ import csv
 import json
 import gzip
 import random
+import bisect
 import shutil
+import weakref
 import itertools
+import threading
+import multiprocessing
 
 from tqdm import tqdm
 from typing import *
-from functools import partial
-from itertools import permutations
-from contextlib import suppress
+from typing import Pattern, BinaryIO
+from functools import partial, lru_cache
+from itertools import permutations, repeat
+from collections import deque, Counter
+from contextlib import suppress, nullcontext
+from dataclasses import dataclass, field
 
 from nltk import PCFG, Tree
 from nltk import nonterminals, Nonterminal, Production
 
+from .keybaseddefaultdict import KeyBasedDefaultDict
+
+# isal's igzip reads and writes the same files as gzip, but much faster. it is optional
+try:
+	from isal import igzip as _fast_gzip
+except ImportError:
+	_fast_gzip = gzip
+
+# orjson serializes much faster than json, but is optional.
+# the fallback writes the same compact separators as orjson, so the files don't depend on which is installed
+try:
+	import orjson
+	_dumps = orjson.dumps
+except ImportError:
+	def _dumps(obj: Any) -> bytes:
+		return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 ALL_MODELS: Set[str] = {
 	f'google/t5-{size}' 
 	for size in [
@@ -28,18 +52,42 @@ ALL_MODELS: Set[str] = {
 	# + ['large', 'xl', 'xxl']
 }
 
+# gets the number (or other feature) a symbol is marked for, after its first underscore.
+# compiled once here instead of for every example
+_RE_TRAILING_NUM = re.compile(r'_(.*)$')
+
+# maps a symbol to the number it is marked for ('sg' or 'pl'), or None if it isn't.
+# filled in as symbols are looked up, so each symbol's ending is only checked once
+_SYMBOL_NUMBERS = KeyBasedDefaultDict(
+	lambda symbol: symbol[-2:] if symbol[-2:] in ('sg', 'pl') else None
+)
+
+# below this many examples, starting worker processes costs more than it saves
+MIN_PARALLEL_EXAMPLES: int = 1000
+
+# how many examples each task sent to a worker process generates. each task gets its own seed
+PARALLEL_CHUNK_SIZE: int = 256
+
+# how many examples to serialize before writing them out together
+WRITE_BATCH_SIZE: int = 1000
+
+# compression level for the dataset files. gzip defaults to 9, but on these files 3 compresses
+# about 8x faster for files about 1.5x larger. 3 is also the highest level isal supports
+COMPRESS_LEVEL: int = 3
+
 def generate(
 	grammar: PCFG, 
 	start: str = None, 
 	depth: int = None
 ) -> Tree:
 	"""
-	Generates an iterator of all sentences from a CFG.
+	Generates a random sentence from a PCFG.
+	Generation does not recurse, so deep trees are not limited by Python's recursion limit.
 
 	:param grammar: The Grammar used to generate sentences.
 	:param start: The Nonterminal from which to start generate sentences.
 	:param depth: The maximal depth of the generated tree.
-	:param n: The maximum number of sentences to return.
+				  If the tree being generated would be deeper than this, a ValueError is raised.
 
 	:return: a Tree generated by the PCFG.
 	"""
@@ -49,37 +97,85 @@ def generate(
 	tree  = _generate(grammar, items, depth)
 	return tree[0]
 
+# the production distributions for each grammar that has been generated from.
+# keyed by the grammar itself rather than its id, since ids can be reused once a grammar is garbage collected,
+# and weakly, so that caching a grammar's distributions doesn't keep it alive
+_RULE_DISTRIBUTIONS: 'weakref.WeakKeyDictionary[PCFG,Dict[Nonterminal,Tuple]]' = weakref.WeakKeyDictionary()
+
+def _get_rule_distributions(grammar: PCFG) -> Dict[Nonterminal,Tuple]:
+	'''
+	Gets the cumulative probability distribution over the productions for each nonterminal in a grammar.
+	This is computed once per grammar, so that sampling a production does not need to
+	refilter the grammar's productions and resum their probabilities every time.
+	
+	:param grammar: the grammar to get distributions for
+	:return distributions: a dict mapping each lhs nonterminal to a tuple of
+						   (cumulative probabilities of its productions, the rhs of each production).
+						   Each symbol in a rhs is paired with its own distribution (None for terminals),
+						   so that generation does not need to look up each symbol as it is expanded.
+	'''
+	if grammar not in _RULE_DISTRIBUTIONS:
+		prods_by_lhs = {}
+		for prod in grammar.productions():
+			prods_by_lhs.setdefault(prod.lhs(), []).append(prod)
+		
+		distributions = {}
+		for lhs, prods in prods_by_lhs.items():
+			# make sure the last production catches any probability mass lost to rounding
+			cum_probs = tuple(itertools.accumulate(prod.prob() for prod in prods[:-1])) + (float('inf'),)
+			distributions[lhs] = (cum_probs, [prod.rhs() for prod in prods])
+		
+		# the rhss stay lists, since they are filled in after every distribution exists
+		# (rules can be recursive, so a distribution can end up containing itself)
+		for _, rhss in distributions.values():
+			rhss[:] = [tuple((symbol, distributions.get(symbol)) for symbol in rhs) for rhs in rhss]
+		
+		_RULE_DISTRIBUTIONS[grammar] = distributions
+	
+	return _RULE_DISTRIBUTIONS[grammar]
+
 def _generate(
 	grammar: PCFG, 
 	items: List[str], 
 	depth: int = None
-) -> Tree:
+) -> List[Tree]:
 	'''
 	Generates a sentence Tree from the passed grammar.
 	
 	:param grammar: the grammar used to generate a sentence
 	:param items: the starting node
-	:param depth: the maximum tree depth
+	:param depth: the maximum tree depth. raises a ValueError if a tree would need to be deeper than this
 	
 	:return result: a sentence as a nested list of nodes
 	'''
-	if depth > 0:
-		result = []
-		for i in items:
-			p = random.random()
-			total_rule_prob = 0.
-			if isinstance(i, Nonterminal):
-				for prod in grammar.productions(lhs=i):
-					total_rule_prob += prod.prob()
-					if p < total_rule_prob:
-						expansion = _generate(grammar, prod.rhs(), depth - 1)
-						result += [Tree(i, expansion)]
-						break
-			else:
-				result += [i]
-				break
+	distributions = _get_rule_distributions(grammar)
+	
+	result = []
+	# each entry is (the list to add the expansion to, the symbol to expand, its distribution, the remaining depth)
+	# items are pushed in reverse so that they are expanded left to right
+	stack = [(result, item, distributions.get(item), depth) for item in reversed(items)]
+	
+	# bound locally since these are called once per node or per production
+	push, pop = stack.append, stack.pop
+	draw, choose = random.random, bisect.bisect
+	while stack:
+		parent, symbol, distribution, remaining_depth = pop()
+		# raise rather than leave a node unexpanded, which would produce a truncated tree
+		if remaining_depth <= 0:
+			raise ValueError(f'Cannot expand {symbol!r} without exceeding the maximum depth ({depth}).')
+		
+		if distribution is None:
+			parent.append(symbol)
+			continue
 		
-		return result
+		cum_probs, rhss = distribution
+		node = Tree(symbol, [])
+		parent.append(node)
+		remaining_depth -= 1
+		for child, child_distribution in reversed(rhss[choose(cum_probs, draw())]):
+			push((node, child, child_distribution, remaining_depth))
+	
+	return result
 
 def format_tree_string(
 	t: Tree, 
@@ -93,22 +189,31 @@ def format_tree_string(
 	:param pfx: str: whether the sentence is past or present (currently unused)
 	:return: the flattened version of the tree as a string
 	"""
+	# the grammars' terminals are lowercase and contain no surrounding whitespace,
+	# so we only need to uppercase the first character (unlike str.capitalize, this leaves the rest alone)
 	flattened_tree = ' '.join(t.leaves())
-	flattened_tree = flattened_tree.strip()
-	flattened_tree = flattened_tree.capitalize()
-	flattened_tree += '.'
+	flattened_tree = flattened_tree[:1].upper() + flattened_tree[1:] + '.'
 	
 	return flattened_tree
 
+# directories that create_data_path has already made sure exist, so it doesn't check the filesystem again.
+# if one of these is removed while the process is running, it will not be recreated
+_DIRS_CREATED: Set[str] = set()
+
 def create_data_path(d: str) -> None:
 	'''
 	Creates a path if one does not exist. Treats final split as a file prefix.
 	'''
 	split_d = os.path.split(d)
 	if len(split_d) > 1:
+		if split_d[0] in _DIRS_CREATED:
+			return
+		
 		if not os.path.isdir(split_d[0]):
 			print(f'Creating directory @ "{split_d[0]}"')
-			os.makedirs(split_d[0])
+			os.makedirs(split_d[0], exist_ok=True)
+		
+		_DIRS_CREATED.add(split_d[0])
 
 def get_labels(t: Tree) -> List[str]:
 	'''
@@ -118,10 +223,16 @@ def get_labels(t: Tree) -> List[str]:
 	:returns labels: a list of the labels of the Tree as strings,
 					 corresponding to the linear order in which they would be printed.
 	'''
-	labels = [t.label().symbol()]
-	for child in t:
-		if isinstance(child, Tree):
-			labels.extend(get_labels(child))
+	labels = []
+	# nodes are pushed in reverse so that they are popped in linear order
+	stack = [t]
+	# bound locally to avoid attribute lookups for every node
+	append, pop, extend = labels.append, stack.pop, stack.extend
+	while stack:
+		node = pop()
+		label = node.label()
+		append(label if isinstance(label, str) else label.symbol())
+		extend([child for child in reversed(node) if isinstance(child, Tree)])
 	
 	return labels
 
@@ -135,21 +246,31 @@ def get_pos_labels(t: Tree) -> List[str]:
 					 corresponding to the linear order in which they would be printed.
 	'''
 	labels = []
-	for child in t:
+	# nodes are pushed in reverse so that they are popped in linear order
+	stack = list(reversed(t))
+	# bound locally to avoid attribute lookups for every node
+	append, pop, extend = labels.append, stack.pop, stack.extend
+	while stack:
+		child = pop()
 		if isinstance(child, Tree) and not isinstance(child[0], str):
-			labels.extend(get_pos_labels(child))
+			extend(reversed(child))
 		elif isinstance(child, str) or child[0] == '':
 			pass
 		elif not isinstance(child.label(), str):
-			labels.append(child.label().symbol())
+			append(child.label().symbol())
 		else:
-			labels.append(child.label())
+			append(child.label())
 	
 	return labels
 
+@lru_cache(maxsize=None)
+def _compile_regex(expr: str) -> Pattern:
+	'''Compile a regex, caching the result so repeated string patterns are only compiled once.'''
+	return re.compile(expr)
+
 def grep_next_subtree(
 	t: Tree,
-	expr: str
+	expr: Union[str,Pattern]
 ) -> Tree:
 	"""
 	Get the next subtree whose label matches the expr.
@@ -157,16 +278,28 @@ def grep_next_subtree(
 	Note that this is different from the behavior of Tree.subtrees, which returns results
 	ordered by linear precedence.
 	:param t: Tree: the tree to search.
-	:param expr: a regex to search when searching the tree
+	:param expr: a regex (as a string or a compiled pattern) to search when searching the tree
 	:returns Tree: the next highest subtree in t whose label's symbol matches expr
 	"""
-	positions = sorted(t.treepositions(), key=lambda t: (len(t), t))
-	for position in positions:
-		if not isinstance(t[position],str) and re.search(expr, str(t[position].label())):
-			return t[position]
+	pattern = _compile_regex(expr) if isinstance(expr, str) else expr
+	
+	# breadth-first, so the first match is the highest (and then leftmost) one
+	queue = deque([t])
+	while queue:
+		node = queue.popleft()
+		if pattern.search(str(node.label())):
+			return node
+		
+		queue.extend(child for child in node if isinstance(child, Tree))
 
 def get_english_RC_PP_pos_seq(pos_seq: List[str]) -> str:
 	'''Remove unwanted info from English pos tags for comparison purposes and return as a string.'''
+	# the grammars only produce a limited number of distinct pos sequences, so most of these are cache hits
+	return _get_english_RC_PP_pos_seq_tuple(tuple(pos_seq))
+
+@lru_cache(maxsize=65536)
+def _get_english_RC_PP_pos_seq_tuple(pos_seq: Tuple[str]) -> str:
+	'''Does the work for get_english_RC_PP_pos_seq, taking a (hashable) tuple so the result can be cached.'''
 	pos_seq = [
 		pos_tag
 			.replace('_sg', '')
@@ -177,6 +310,84 @@ def get_english_RC_PP_pos_seq(pos_seq: List[str]) -> str:
 	
 	return pos_seq 
 
+@dataclass
+class _MetadataFields:
+	"""
+	The parts of an English RC/PP example's tree that its metadata is computed from.
+	:field subject_nouns: the symbols of the sg and pl nodes in the main clause subject, in linear order,
+						  each paired with the set of CP and PP labels that dominate it inside the subject.
+						  The first of these is the head noun of the subject.
+	:field object_noun: the symbol of the head noun of the main clause object
+	:field main_verb: the main clause verb
+	:field pos_labels: the part-of-speech labels of the whole tree, as returned by get_pos_labels
+	"""
+	subject_nouns: List[Tuple[str,FrozenSet[str]]] = field(default_factory=list)
+	object_noun: str = None
+	main_verb: str = None
+	pos_labels: List[str] = field(default_factory=list)
+
+def _collect_metadata_fields(t: Tree) -> _MetadataFields:
+	"""
+	Collects everything get_english_RC_PP_example_metadata needs from a tree in a single walk,
+	instead of searching the tree separately for each piece.
+	The main clause subject, object, and verb are the highest (and then leftmost) DP, VP, and V,
+	which are what grep_next_subtree would find. Like the example generators, this assumes that
+	the head noun of a DP is the first noun in it.
+	:param t: Tree: the tree to collect metadata fields from
+	:returns fields: _MetadataFields: the fields collected from the tree
+	"""
+	fields = _MetadataFields()
+	
+	# the highest DP and VP found so far, and their depths.
+	# since nodes are visited in linear order, a node at the same depth as the current best is further right
+	subject, subject_depth 		= None, sys.maxsize
+	predicate, predicate_depth 	= None, sys.maxsize
+	main_verb_depth 			= sys.maxsize
+	
+	# the nouns in each DP and VP that is not inside another DP or VP, keyed by id
+	nouns = {}
+	
+	# each entry is (node, depth, the outermost DP above it, the outermost VP above it, the CP and PP labels above it in that DP)
+	stack = [(t, 0, None, None, frozenset())]
+	while stack:
+		node, depth, outer_dp, outer_vp, dominating_labels = stack.pop()
+		symbol = node.label().symbol()
+		
+		if symbol == 'DP' and outer_dp is None:
+			outer_dp, dominating_labels = node, frozenset()
+			nouns[id(node)] = []
+			if depth < subject_depth:
+				subject, subject_depth = node, depth
+		elif symbol == 'VP' and outer_vp is None:
+			outer_vp = node
+			nouns[id(node)] = []
+			if depth < predicate_depth:
+				predicate, predicate_depth = node, depth
+		elif symbol == 'V' and depth < main_verb_depth:
+			fields.main_verb, main_verb_depth = node[0], depth
+		elif _SYMBOL_NUMBERS[symbol]:
+			if outer_dp is not None:
+				nouns[id(outer_dp)].append((symbol, dominating_labels))
+			
+			if outer_vp is not None:
+				nouns[id(outer_vp)].append((symbol, dominating_labels))
+		elif symbol in ['CP', 'PP']:
+			dominating_labels = dominating_labels | {symbol}
+		
+		if isinstance(node[0], str):
+			if node[0] != '':
+				fields.pos_labels.append(symbol)
+		else:
+			stack.extend([
+				(child, depth + 1, outer_dp, outer_vp, dominating_labels) 
+				for child in reversed(node) if isinstance(child, Tree)
+			])
+	
+	fields.subject_nouns = nouns[id(subject)]
+	fields.object_noun = nouns[id(predicate)][0][0]
+	
+	return fields
+
 def get_english_RC_PP_example_metadata(
 	source: Tree,
 	pfx: str,
@@ -197,69 +408,40 @@ def get_english_RC_PP_example_metadata(
 					   - the number of adverbial clauses
 					   - the PoS sequence of the source and target
 	"""
-	source = source.copy(deep=True)
-	target = target.copy(deep=True)
-	
+	# source and target are only read here, never modified, so there is no need to copy them.
+	# keep it that way (or copy them first) if you change this function
 	metadata = {}
-	
-	# definiteness of main clause subject
-	main_clause_subject = grep_next_subtree(source, r'^DP$')
-	main_clause_subject = grep_next_subtree(main_clause_subject, r'^NP$')
-	while grep_next_subtree(main_clause_subject[0], r'^NP$'):
-		main_clause_subject = grep_next_subtree(main_clause_subject[0], r'^NP$')
-	
-	main_clause_subject = grep_next_subtree(main_clause_subject, r'^N_')
+	fields = _collect_metadata_fields(source)
 	
 	# number of main clause subject
-	if main_clause_subject.label().symbol().endswith('sg'):
+	if _SYMBOL_NUMBERS[fields.subject_nouns[0][0]] == 'sg':
 		metadata.update({'subject_number': 'sg'})
 	else:
 		metadata.update({'subject_number': 'pl'})
 	
-	main_clause_verb_phrase = grep_next_subtree(source, r'^VP$')
-	main_clause_object = grep_next_subtree(main_clause_verb_phrase, r'^DP$')
-	main_clause_object = grep_next_subtree(main_clause_object, r'^NP$')
-	while grep_next_subtree(main_clause_object[0], r'^NP$'):
-		main_clause_object = grep_next_subtree(main_clause_object[0], r'^NP$')
-	
-	main_clause_object = grep_next_subtree(main_clause_object, r'^N_')
-		
 	# number of main clause object
-	if main_clause_object.label().symbol().endswith('sg'):
+	if _SYMBOL_NUMBERS[fields.object_noun] == 'sg':
 		metadata.update({'object_number': 'sg'})
 	else:
 		metadata.update({'object_number': 'pl'})
 	
 	# main verb
-	main_clause_verb = grep_next_subtree(source, r'^V$')
-	metadata.update({'main_verb': main_clause_verb[0]})
+	metadata.update({'main_verb': fields.main_verb})
 	
 	# number of total, singular, and plural noun phrases between the head noun of the subject and the verb
-	main_clause_full_subject = grep_next_subtree(source, r'^DP$')
-	main_clause_full_subject = grep_next_subtree(main_clause_full_subject, r'^NP$')
-	labels = get_labels(main_clause_full_subject)
-	
-	intervener_positions = [
-		position 
-		for position in main_clause_full_subject.treepositions() 
-			if  hasattr(main_clause_full_subject[position], '_label') and
-				(
-					main_clause_full_subject[position].label().symbol().endswith('sg') or 
-					main_clause_full_subject[position].label().symbol().endswith('pl')
-				)
-	][1:]
+	# the first one is the head noun of the subject
+	interveners = fields.subject_nouns[1:]
 	
-	if intervener_positions:
-		final_intervener_number = re.findall(
-			r'_(.*)', main_clause_full_subject[intervener_positions[-1]].label().symbol()
-		)[0]
+	if interveners:
+		final_intervener_number = _RE_TRAILING_NUM.search(interveners[-1][0])
+		final_intervener_number = final_intervener_number.group(1) if final_intervener_number else None
 		
 		metadata.update({'final_intervener_number': final_intervener_number})
 	else:
 		metadata.update({'final_intervener_number': None})
 	
 	# then filter to the sg or pl nouns after that
-	pre_main_verb_noun_labels = [pos for pos in labels if pos.endswith('sg') or pos.endswith('pl')]
+	pre_main_verb_noun_labels = [symbol for symbol, _ in fields.subject_nouns]
 	
 	# since the first noun in the list represents the subject, we exclude everything that matches it,
 	# since matching nouns are not "distractors"
@@ -276,20 +458,10 @@ def get_english_RC_PP_example_metadata(
 		# first position is the subject
 		
 		# are the distractors in RCs or PPs or both?
-		distractor_positions = [
-			pos 
-			for pos in intervener_positions
-				if not re.findall(r'^N_(.*)$', str(main_clause_full_subject[pos].label())) == metadata['subject_number']
-		]
-		
-		distractor_path_labels = [
-			set([
-				str(main_clause_full_subject[path[:i]].label()) 
-				for i, _ in enumerate(path)
-					if str(main_clause_full_subject[path[:i]].label()) in ['CP', 'PP']
-			])
-			for path in distractor_positions
-		]
+		# note that this includes interveners that match the subject's number. the comparison
+		# originally used to filter these out compared a list to a string, so it never excluded anything,
+		# and the existing datasets' metadata reflects that
+		distractor_path_labels = [dominating_labels for _, dominating_labels in interveners]
 		
 		distractor_structures = ['both' if len(ls) == 2 else ''.join(ls) for ls in distractor_path_labels]
 		
@@ -316,13 +488,19 @@ def get_english_RC_PP_example_metadata(
 		})
 	
 	# get pos seq with details suppressed	
-	pos_seq = get_english_RC_PP_pos_seq(get_pos_labels(source))
+	pos_seq = get_english_RC_PP_pos_seq(fields.pos_labels)
 	metadata.update({'pos_sequence': pos_seq})
 	
 	metadata.update({'tense': pfx})
 	
 	return metadata
 
+# maps a grammar's lang to the function that gets metadata for its examples
+_METADATA_FN_MAP: Dict[str,Callable] = {
+	'en_RC_PP': get_english_RC_PP_example_metadata,
+	'en_RC_PP_gen': get_english_RC_PP_example_metadata,
+}
+
 def get_example_metadata(
 	grammar: PCFG,
 	*args, 
@@ -335,14 +513,150 @@ def get_example_metadata(
 	:param kwargs: passed to get_lang_example_metadata()
 	:returns metadata: a dictionary recording language-specific properties for the example
 	"""
-	function_map = {
-		'en_RC_PP': get_english_RC_PP_example_metadata,
-		'en_RC_PP_gen': get_english_RC_PP_example_metadata,
-	}
+	metadata_fn = _METADATA_FN_MAP.get(grammar.lang)
+	metadata = metadata_fn(*args, **kwargs) if metadata_fn is not None else {}
 	
-	metadata = function_map.get(grammar.lang, lambda: {})(*args, **kwargs)
+	return metadata
+
+def _make_one(
+	grammar: PCFG,
+	ex_generator: Callable
+) -> Tuple[Dict,Dict]:
+	"""
+	Generates a single example and its metadata.
+	:param grammar: PCFG: a PCFG object
+	:param ex_generator: function: a function that creates a pair of sentences and associated tags from the grammar
+	:returns (ex, metadata): the formatted example and its metadata
+	"""
+	source, pfx, target = ex_generator(grammar)
+	ex = {
+		'translation': {
+			'src'	: format_tree_string(source, grammar.lang, pfx),
+			'prefix': pfx,
+			'tgt'	: format_tree_string(target, grammar.lang, pfx)
+		}
+	}
+
+	return ex, get_example_metadata(grammar, source, pfx, target)
+
+# the grammar and example generator used in a worker process, set by _init_worker
+_worker_grammar: PCFG = None
+_worker_ex_generator: Callable = None
+
+def _init_worker(
+	grammar: PCFG,
+	ex_generator: Callable
+) -> None:
+	"""
+	Sets up a worker process to generate examples from the grammar with ex_generator.
+	This is done once per worker, so the grammar isn't sent along with every task.
+	:param grammar: PCFG: a PCFG object
+	:param ex_generator: function: a function that creates a pair of sentences and associated tags from the grammar
+	"""
+	global _worker_grammar, _worker_ex_generator
+	_worker_grammar 		= grammar
+	_worker_ex_generator 	= ex_generator
+
+def _make_chunk_in_worker(task: Tuple[int,int]) -> List[Tuple[Dict,Dict]]:
+	"""
+	Generates a chunk of examples and their metadata in a worker process set up by _init_worker.
+	The random number generator is seeded first, so the chunk doesn't depend on which worker generates it,
+	or on what that worker generated before.
+	:param task: Tuple[int,int]: the seed to generate the chunk from, and the number of examples in the chunk
+	:returns: a list of (example, metadata) tuples
+	"""
+	seed, n_examples = task
+	random.seed(seed)
+	return [_make_one(_worker_grammar, _worker_ex_generator) for _ in range(n_examples)]
+
+def _make_example_pool(
+	grammar: PCFG,
+	ex_generator: Callable,
+	n_examples: int
+) -> 'ContextManager[Optional[multiprocessing.pool.Pool]]':
+	"""
+	Starts the worker processes to generate examples with, if there are enough examples for that to be worth it.
+	Where possible, worker processes are forked, so they share the grammar with the parent process without pickling it.
+	Forking a process while another thread is running can deadlock the children, so this should be called
+	before starting any progress bars, and if other threads are running anyway, workers are started fresh instead.
+	:param grammar: PCFG: a PCFG object
+	:param ex_generator: function: a function that creates a pair of sentences and associated tags from the grammar
+	:param n_examples: int: the number of examples that will be generated
+	:returns: a context manager for a pool of one process per usable cpu if there are at least MIN_PARALLEL_EXAMPLES examples
+			  and at least two usable cpus, and for None otherwise
+	"""
+	# os.cpu_count counts every cpu on the machine, including ones this process isn't allowed to run on
+	# (e.g., when a job scheduler like SLURM limits it to a few). sched_getaffinity is not available everywhere
+	n_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+	
+	# a single worker only adds the cost of sending examples back from it
+	if n_examples < MIN_PARALLEL_EXAMPLES or n_cpus < 2:
+		return nullcontext()
+	
+	# fork is not available on Windows, and forkserver only exists where fork does
+	start_methods = multiprocessing.get_all_start_methods()
+	if 'fork' in start_methods and threading.active_count() == 1:
+		start_method = 'fork'
+	elif 'forkserver' in start_methods:
+		start_method = 'forkserver'
+	else:
+		start_method = 'spawn'
 	
-	return metadata	
+	return multiprocessing.get_context(start_method).Pool(
+		n_cpus,
+		initializer=_init_worker,
+		initargs=(grammar, ex_generator),
+	)
+
+def _generate_examples(
+	grammar: PCFG,
+	ex_generator: Callable,
+	n_examples: int,
+	pool: 'multiprocessing.pool.Pool' = None
+) -> Iterator[Tuple[Dict,Dict]]:
+	"""
+	Generates examples and their metadata.
+	:param grammar: PCFG: a PCFG object
+	:param ex_generator: function: a function that creates a pair of sentences and associated tags from the grammar
+	:param n_examples: int: the number of examples to generate
+	:param pool: Pool: worker processes set up by _make_example_pool to generate the examples with.
+					   if None, the examples are generated in this process
+	:returns: an iterator over (example, metadata) tuples. When generated in parallel, these are in no particular order,
+			  but seeding random beforehand still reproduces the same examples
+	"""
+	if pool is None:
+		yield from map(_make_one, repeat(grammar, n_examples), repeat(ex_generator, n_examples))
+	else:
+		# each chunk's seed comes from the parent's random state, so seeding random before this
+		# reproduces the same chunks however the workers share them out
+		tasks = [
+			(random.getrandbits(64), min(PARALLEL_CHUNK_SIZE, n_examples - start))
+			for start in range(0, n_examples, PARALLEL_CHUNK_SIZE)
+		]
+		
+		# the chunks are independent, so we take them in whatever order they finish
+		for chunk in pool.imap_unordered(_make_chunk_in_worker, tasks):
+			yield from chunk
+
+class _UnmonitoredTqdm(tqdm):
+	'''
+	A tqdm progress bar that doesn't start tqdm's monitor thread.
+	Once started, that thread keeps running after the bar is closed, so worker processes
+	for any later dataset split would be forked while it is running.
+	'''
+	monitor_interval = 0
+
+def _write_batch(
+	f: BinaryIO,
+	batch: List[bytes]
+) -> None:
+	"""
+	Writes a batch of serialized examples to a file in one call, and then empties the batch.
+	:param f: BinaryIO: a file opened in binary mode
+	:param batch: List[bytes]: the serialized examples, each ending in a newline
+	"""
+	f.write(b''.join(batch))
+	batch.clear()
 
 def create_dataset_json(
 	grammar: PCFG, 
@@ -365,38 +679,33 @@ def create_dataset_json(
 	create_data_path(os.path.join('data', file_prefix))
 
 	for name, n_examples in splits.items():
-		metadata = []
 		if not os.path.exists(os.path.join('data', file_prefix + name + '.json.gz')) or overwrite:
-			prefixes = {}
-			l = []
-			print(f'Generating {name} examples')
-			for n in tqdm(range(n_examples)):
-				source, pfx, target = ex_generator(grammar)
-				metadata.append(get_example_metadata(grammar, source, pfx, target))
-				prefixes[pfx] = 1 if not pfx in prefixes else prefixes[pfx] + 1
-				l += [{
-					'translation': {
-						'src'	: format_tree_string(source, grammar.lang, pfx), 
-						'prefix': pfx, 
-						'tgt'	: format_tree_string(target, grammar.lang, pfx)
-					}
-				}]
-			
-			for pfx in prefixes:
-				print(f'{name} prop {pfx} examples: {prefixes[pfx]/n_examples}')
-			
-			if l:
+			if n_examples:
+				prefixes = Counter()
+				print(f'Generating {name} examples')
 				print('Saving examples to data/' + file_prefix + name + '.json.gz')
-				with gzip.open(os.path.join('data', file_prefix + name + '.json.gz'), 'wt', encoding='utf-8') as f:
-					for ex in tqdm(l):
-						json.dump(ex, f, ensure_ascii=False)
-						f.write('\n')
-				
 				print('Saving metadata to data/' + file_prefix + name + '_metadata.json.gz')
-				with gzip.open(os.path.join('data', file_prefix + name + '_metadata.json.gz'), 'wt', encoding='utf-8') as f:
-					for ex in tqdm(metadata):
-						json.dump(ex, f, ensure_ascii=False)
-						f.write('\n')
+				# the pool is started before the progress bar, which can start a thread
+				with _make_example_pool(grammar, ex_generator, n_examples) as pool, \
+					 _fast_gzip.open(os.path.join('data', file_prefix + name + '.json.gz'), 'wb', compresslevel=COMPRESS_LEVEL) as data_f, \
+					 _fast_gzip.open(os.path.join('data', file_prefix + name + '_metadata.json.gz'), 'wb', compresslevel=COMPRESS_LEVEL) as metadata_f:
+					data_batch, metadata_batch = [], []
+					for ex, ex_metadata in _UnmonitoredTqdm(_generate_examples(grammar, ex_generator, n_examples, pool), total=n_examples):
+						data_batch.append(_dumps(ex) + b'\n')
+						metadata_batch.append(_dumps(ex_metadata) + b'\n')
+						
+						if len(data_batch) == WRITE_BATCH_SIZE:
+							_write_batch(data_f, data_batch)
+							_write_batch(metadata_f, metadata_batch)
+						
+						pfx = ex['translation']['prefix']
+						prefixes[pfx] += 1
+					
+					_write_batch(data_f, data_batch)
+					_write_batch(metadata_f, metadata_batch)
+				
+				for pfx in prefixes:
+					print(f'{name} prop {pfx} examples: {prefixes[pfx]/n_examples}')
 			
 			print('')
 		else:
@@ -417,13 +726,11 @@ def combine_dataset_jsons(
 	if not os.path.exists(os.path.join('data', file_prefix + '.json.gz')) or overwrite:
 		create_data_path(os.path.join('data', file_prefix))
 		
-		combined = ''
-		for file in files:
-			with gzip.open(os.path.join('data', file + ('.json.gz' if not file.endswith('.json.gz') else '')), 'rt', encoding='utf-8') as in_file:
-				combined += in_file.read()
-		
-		with gzip.open(os.path.join('data', file_prefix + '.json.gz'), 'wt', encoding='utf-8') as f:
-			f.write(combined)
+		# copy the decompressed bytes straight across, so we never hold a whole file in memory
+		with _fast_gzip.open(os.path.join('data', file_prefix + '.json.gz'), 'wb', compresslevel=COMPRESS_LEVEL) as f:
+			for file in files:
+				with _fast_gzip.open(os.path.join('data', file + ('.json.gz' if not file.endswith('.json.gz') else '')), 'rb') as in_file:
+					shutil.copyfileobj(in_file, f, length=1024*1024)
 
 def create_tense_datasets(
 	configs: Dict[str,List] = None, 
@@ -547,6 +854,52 @@ def create_datasets_from_config(
 	# combine_language_datasets_for_tense(list(configs.keys()), **kwargs)
 	create_scripts(configs, **kwargs)
 
+# templates for the finetuning and eval scripts created by create_scripts,
+# filled in with str.format_map
+_SCRIPT_TEMPLATE = '\n'.join([
+	'#!/bin/bash\n',
+	'#SBATCH --job-name={model}-finetune-tense-{train_lang}',
+	'#SBATCH --output=joblogs/%x_%j.txt',
+	'#SBATCH --nodes=1',
+	'#SBATCH --cpus-per-task=1',
+	'#SBATCH --mem=30GB',
+	'#SBATCH --time=10:00:00',
+	'#SBATCH --gpus=v100:1',
+	'#SBATCH --partition=gpu',
+	'#SBATCH --mail-type=END,FAIL,INVALID_DEPEND',
+	'',
+	'module load CUDA',
+	'module load cuDNN',
+	'module load miniconda',
+	'',
+	'source activate /gpfs/gibbs/project/frank/ref4/conda_envs/py38-agratt',
+	'',
+	'python core/run_seq2seq.py \\',
+	"	--model_name_or_path '{model_name_or_path}' \\",
+	'	--do_train \\',
+	'	--task translation_src_to_tgt \\',
+	'	--train_file data/{train_lang}/{train_lang}_train.json.gz \\',
+	'	--validation_file data/{dev_lang}/{dev_lang}_dev.json.gz \\',
+	'	--output_dir outputs/{model}-finetuning-{train_lang}-bs128/ \\',
+	'	--per_device_train_batch_size=4 \\',
+	'	--gradient_accumulation_steps=32 \\',
+	'	--per_device_eval_batch_size=16 \\',
+	'	--overwrite_output_dir \\',
+	'	--predict_with_generate \\',
+	'	--num_train_epochs 10.0'
+]) + '\n'
+
+_EVAL_SCRIPT_TEMPLATE = _SCRIPT_TEMPLATE.replace('finetune', 'eval')
+_EVAL_SCRIPT_TEMPLATE = _EVAL_SCRIPT_TEMPLATE.replace('--do_train \\', '--do_learning_curve \\')
+_EVAL_SCRIPT_TEMPLATE = _EVAL_SCRIPT_TEMPLATE.replace('{dev_lang}', '{test_lang}')
+_EVAL_SCRIPT_TEMPLATE = re.sub(r'_dev(\.|_)', '_test\\1', _EVAL_SCRIPT_TEMPLATE)
+_EVAL_SCRIPT_TEMPLATE = _EVAL_SCRIPT_TEMPLATE.replace('--per_device_train_batch_size=4', '--per_device_train_batch_size=8')
+_EVAL_SCRIPT_TEMPLATE = _EVAL_SCRIPT_TEMPLATE.replace('	--gradient_accumulation_steps=32 \\\n', '')
+_EVAL_SCRIPT_TEMPLATE = _EVAL_SCRIPT_TEMPLATE.replace(
+	'	--predict_with_generate \\\n	--num_train_epochs 10.0', 
+	'	--predict_with_generate \\'
+)
+
 def create_scripts(
 	configs: Dict = None, 
 	overwrite: bool = False
@@ -558,54 +911,17 @@ def create_scripts(
 	
 	If no argument is passed, attempt to load the language ids from a file ./data/config.json
 	'''	
-	script = '\n'.join([
-		'#!/bin/bash\n',
-		'#SBATCH --job-name=[MODEL]-finetune-tense-[TRAIN_LANG]',
-		'#SBATCH --output=joblogs/%x_%j.txt',
-		'#SBATCH --nodes=1',
-		'#SBATCH --cpus-per-task=1',
-		'#SBATCH --mem=30GB',
-		'#SBATCH --time=10:00:00',
-		'#SBATCH --gpus=v100:1',
-		'#SBATCH --partition=gpu',
-		'#SBATCH --mail-type=END,FAIL,INVALID_DEPEND',
-		'',
-		'module load CUDA',
-		'module load cuDNN',
-		'module load miniconda',
-		'',
-		'source activate /gpfs/gibbs/project/frank/ref4/conda_envs/py38-agratt',
-		'',
-		'python core/run_seq2seq.py \\',
-		"	--model_name_or_path '[MODEL_NAME_OR_PATH]' \\",
-		'	--do_train \\',
-		'	--task translation_src_to_tgt \\',
-		'	--train_file data/[TRAIN_LANG]/[TRAIN_LANG]_train.json.gz \\',
-		'	--validation_file data/[DEV_LANG]/[DEV_LANG]_dev.json.gz \\',
-		'	--output_dir outputs/[MODEL]-finetuning-[TRAIN_LANG]-bs128/ \\',
-		'	--per_device_train_batch_size=4 \\',
-		'	--gradient_accumulation_steps=32 \\',
-		'	--per_device_eval_batch_size=16 \\',
-		'	--overwrite_output_dir \\',
-		'	--predict_with_generate \\',
-		'	--num_train_epochs 10.0'
-	]) + '\n'
-	
-	eval_script = script.replace('finetune', 'eval')
-	eval_script = eval_script.replace('--do_train \\', '--do_learning_curve \\')
-	eval_script = eval_script.replace('[DEV_LANG]', '[TEST_LANG]')
-	eval_script = re.sub(r'_dev(\.|_)', '_test\\1', eval_script)
-	eval_script = eval_script.replace('--per_device_train_batch_size=4', '--per_device_train_batch_size=8')
-	eval_script = eval_script.replace('	--gradient_accumulation_steps=32 \\\n', '')
-	eval_script = eval_script.replace(
-		'	--predict_with_generate \\\n	--num_train_epochs 10.0', 
-		'	--predict_with_generate \\'
-	)
-	
 	configs 	= load_config() if configs is None else configs
 	all_pairs 	= [tuple(pair) for pair in configs['pairs']] if 'pairs' in configs else []
 	langs 		= [(f'{lang}-{dataset}',f'{lang}-{dataset}') for lang in configs['langs'] for dataset in configs['langs'][lang]] + all_pairs
 	
+	# list the data files once up front, so checking which datasets exist doesn't hit the filesystem every time
+	data_files	= {
+		os.path.relpath(os.path.join(root, file), 'data')
+		for root, _, files in os.walk('data')
+			for file in files
+	}
+	
 	# create directories if not existant
 	os.makedirs(os.path.join('scripts', 'finetune'), exist_ok=True)
 	os.makedirs(os.path.join('scripts', 'eval'), exist_ok=True)
@@ -613,36 +929,35 @@ def create_scripts(
 	for lang in langs:
 		for model in ALL_MODELS:
 			# create the scripts for each language and pair of languages
-			lang_ft_script = script.replace('[MODEL_NAME_OR_PATH]', model)
-			lang_ft_script = lang_ft_script.replace('[MODEL]', model.split('/')[-1])
-			lang_ev_script = eval_script.replace('[MODEL_NAME_OR_PATH]', model)
-			lang_ev_script = lang_ev_script.replace('[MODEL]', model.split('/')[-1])
-			
 			train_lang 		= lang[0]
 			dev_lang 		= lang[0]
 			# train_dash_lang = lang[0].replace('_', '-')
 			test_lang 		= lang[1]
 			
+			script_fields 	= {
+				'model_name_or_path': model,
+				'model': model.split('/')[-1],
+				'train_lang': train_lang,
+				'dev_lang': dev_lang,
+				'test_lang': test_lang,
+			}
+			
 			file_name 		= '_'.join(lang) if lang[0] != lang[1] else lang[0]
 			
-			if os.path.isfile(os.path.join('data', train_lang, f'{train_lang}_train.json.gz')):
+			if os.path.join(train_lang, f'{train_lang}_train.json.gz') in data_files:
 				print(f'Creating scripts for {" -> ".join(lang)} ({model})')
 				# if the langs are not the same, we do not need to create a separate tuning script, only a separate eval script
 				if (
 					lang[0] == lang[1] and 
-					os.path.isfile(os.path.join('data', dev_lang, f'{dev_lang}_dev.json.gz'))
+					os.path.join(dev_lang, f'{dev_lang}_dev.json.gz') in data_files
 				):
-					lang_ft_script = lang_ft_script.replace('[TRAIN_LANG]', train_lang)
-					lang_ft_script = lang_ft_script.replace('[DEV_LANG]', dev_lang)
-					# lang_ft_script = lang_ft_script.replace('[TRAIN-LANG]', train_dash_lang)
+					lang_ft_script = _SCRIPT_TEMPLATE.format_map(script_fields)
 					if not os.path.exists(os.path.join('scripts', 'finetune', f'finetune_{model.split("/")[-1]}_{file_name}_bs128.sh')) or overwrite:
 						with open(os.path.join('scripts', 'finetune', f'finetune_{model.split("/")[-1]}_{file_name}_bs128.sh'), 'wt') as out_file:
 							out_file.write(lang_ft_script)
 				
-				if os.path.isfile(os.path.join('data', test_lang, f'{test_lang}_test.json.gz')):
-					lang_ev_script = lang_ev_script.replace('[TRAIN_LANG]', train_lang)
-					lang_ev_script = lang_ev_script.replace('[TEST_LANG]', test_lang)
-					# lang_ev_script = lang_ev_script.replace('[TRAIN-LANG]', train_dash_lang)
+				if os.path.join(test_lang, f'{test_lang}_test.json.gz') in data_files:
+					lang_ev_script = _EVAL_SCRIPT_TEMPLATE.format_map(script_fields)
 					if not os.path.exists(os.path.join('scripts', 'eval', f'eval_{model.split("/")[-1]}_{file_name}_bs128.sh')) or overwrite:
 						with open(os.path.join('scripts', 'eval', f'eval_{model.split("/")[-1]}_{file_name}_bs128.sh'), 'wt') as out_file:
 							out_file.write(lang_ev_script)
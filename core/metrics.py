@@ -448,6 +448,29 @@ def only_main_verb_reinflected_correctly(
 			else:
 				return True		
 
+def get_number_labels(t: nltk.Tree) -> List[str]:
+	'''
+	Get the labels of the subtrees marked for number in a tree, in the same (preorder) order
+	as t.treepositions() would find them, without building and re-indexing every position.
+	
+		params:
+			t (nltk.Tree): the tree to get number-marked labels from
+		
+		returns:
+			List[str]: the labels of the subtrees whose labels end in _sg or _pl
+	'''
+	labels = []
+	stack = [t]
+	while stack:
+		node = stack.pop()
+		label = str(node.label())
+		if re.search(r'_(sg|pl)$', label):
+			labels.append(label)
+		
+		stack.extend(child for child in reversed(node) if not isinstance(child, str))
+	
+	return labels
+
 @metric
 def agreement_attraction_closest(
 	pred_sentence: str,
@@ -497,16 +520,11 @@ def agreement_attraction_closest(
 	
 		main_clause_subject_number = str(grep_next_subtree(main_clause_subject_number, r'^N_').label())
 		
-		distractor_positions = [
-			position 
-			for position in main_clause_subject.treepositions() 
-				if 	not isinstance(main_clause_subject[position], str) and
-					re.search(r'_(sg|pl)$', str(main_clause_subject[position].label())) and
-					not str(main_clause_subject[position].label()) == main_clause_subject_number
-		]
+		number_labels = get_number_labels(main_clause_subject)
+		distractor_labels = [label for label in number_labels if not label == main_clause_subject_number]
 		
 		# this means there are no distractors, so therefore there cannot be attraction
-		if not distractor_positions:
+		if not distractor_labels:
 			return None
 		
 		# if there are distractors but the sentences match exactly, there is no attraction
@@ -533,15 +551,9 @@ def agreement_attraction_closest(
 			return False
 		
 		# attraction is defined as incorrect agreement with the final intervener for this metric
-		N_positions = [
-			position 
-			for position in main_clause_subject.treepositions() 
-				if 	not isinstance(main_clause_subject[position], str) and
-					re.search(r'_(sg|pl)$', str(main_clause_subject[position].label()))
-		][1:]
-		
-		final_intervener_position = N_positions[-1]
-		final_intervener_number = re.findall(r'_(.*)', str(main_clause_subject[final_intervener_position].label()))[0]
+		# the first label is the subject's head noun, but there are distractors, so the last one is an intervener
+		final_intervener_label = number_labels[-1]
+		final_intervener_number = re.findall(r'_(.*)', final_intervener_label)[0]
 		
 		# the verb got messed up, but it wasn't attraction to closest since the nouns match
 		if final_intervener_number == subject_number:
@@ -606,16 +618,11 @@ def agreement_attraction_any(
 		
 		main_clause_subject_number = str(grep_next_subtree(main_clause_subject_number, r'^N_').label())
 		
-		distractor_positions = [
-			position 
-			for position in main_clause_subject.treepositions() 
-				if 	not isinstance(main_clause_subject[position], str) and
-					re.search(r'_(sg|pl)$', str(main_clause_subject[position].label())) and
-					not str(main_clause_subject[position].label()) == main_clause_subject_number
-		]
+		number_labels = get_number_labels(main_clause_subject)
+		distractor_labels = [label for label in number_labels if not label == main_clause_subject_number]
 		
 		# this means there are no distractors, so therefore there cannot be attraction
-		if not distractor_positions:
+		if not distractor_labels:
 			return None
 		
 		# if there are distractors but the sentences match exactly, there is no attraction
@@ -642,8 +649,8 @@ def agreement_attraction_any(
 			return False
 		
 		# attraction is defined as incorrect agreement with any distractor
-		for position in distractor_positions:
-			distractor_number = re.findall(r'_(.*)', str(main_clause_subject[position].label()))[0]
+		for label in distractor_labels:
+			distractor_number = re.findall(r'_(.*)', label)[0]
 			
 			# the verb got messed up, and it's attraction since the number of the subjects doesn't match
 			if (